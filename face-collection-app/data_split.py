@@ -43,14 +43,30 @@ def move_folders():
                 source = os.path.join(data_dir, folder)
                 destination = os.path.join(target_dir, year_dir, folder)
                 
+                # Folders using face generations are copied rather than moved, so
+                # that only the current generation ends up in the destination
+                uses_generations = os.path.isdir(os.path.join(source, ".generations"))
+                merging = os.path.exists(destination)
+                
                 # Check if destination already exists
-                if os.path.exists(destination):
-                    print(f"Merging contents of {folder} into existing directory")
+                if merging or uses_generations:
+                    if merging:
+                        print(f"Merging contents of {folder} into existing directory")
+                    else:
+                        os.makedirs(destination)
+                        print(f"Copying current face generation of {folder} to {year_dir}/")
                     
                     # Copy all files and directories from source to destination
                     for item in os.listdir(source):
-                        src_item = os.path.join(source, item)
+                        # Retired generations are left behind; the current one is
+                        # copied as a real directory through the {student_id} link
+                        if item == ".generations":
+                            continue
+                        src_item = os.path.realpath(os.path.join(source, item))
                         dst_item = os.path.join(destination, item)
+                        if not os.path.exists(src_item):
+                            print(f"  Skipping {item}: link target no longer exists")
+                            continue
                         
                         if os.path.isdir(src_item):
                             # If directory exists, merge contents
@@ -77,7 +93,10 @@ def move_folders():
                     
                     # Remove the source directory after merging
                     shutil.rmtree(source)
-                    merged_counts[year_dir] += 1
+                    if merging:
+                        merged_counts[year_dir] += 1
+                    else:
+                        moved_counts[year_dir] += 1
                     moved = True
                     break
                 else:
@@ -10,6 +10,7 @@ import base64
 import cv2
 import numpy as np
 import tempfile
+import shutil
 import time
 import threading
 import queue
@@ -38,6 +39,147 @@ executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 task_queue = queue.Queue(maxsize=15)  # 5 users per thread × 3 threads
 processing_tasks = {}  # Track task status by session ID
 
+# Face crop generations: data/{student_id}/{student_id} is a symlink to the
+# current generation under data/{student_id}/.generations/, so a reset is a
+# single atomic pointer swap and old crops are deleted in the background.
+# Where directory symlinks are unavailable (e.g. Windows) the plain in-place
+# layout is used instead.
+GENERATIONS_DIRNAME = '.generations'
+REAPER_FILES_PER_SECOND = 200  # Rate limit for background crop deletion
+REAPER_MAX_ATTEMPTS = 5  # Give up on a generation after this many failures
+REAPER_RETRY_DELAY = 5  # Seconds before the first retry, doubled per failure
+reap_queue = queue.Queue()  # Old generation directories awaiting deletion
+generation_lock = threading.RLock()  # Serialise pointer swaps
+reaper_lock = threading.Lock()  # Guards the one-time reaper start
+_generations_supported = None
+_reaper_started = False
+
+def generations_supported():
+    """Check once whether directory symlinks can be created and atomically replaced"""
+    global _generations_supported
+    if _generations_supported is None:
+        if os.name == 'nt':
+            # os.replace cannot overwrite a directory symlink on Windows
+            _generations_supported = False
+        else:
+            probe = os.path.join(DATA_DIR, f".symlink-probe-{uuid.uuid4().hex[:8]}")
+            try:
+                os.symlink('.', probe)
+                os.unlink(probe)
+                _generations_supported = True
+            except OSError as e:
+                print(f"Symlinks unavailable, using in-place face directories: {e}")
+                _generations_supported = False
+    return _generations_supported
+
+def start_reaper():
+    """Start the background reaper the first time generations are used"""
+    global _reaper_started
+    with reaper_lock:
+        if not _reaper_started:
+            threading.Thread(target=generation_reaper, daemon=True).start()
+            _reaper_started = True
+
+def retire_generation(generation_dir):
+    """Queue a generation that is no longer current for background deletion"""
+    start_reaper()
+    reap_queue.put(generation_dir)
+
+def new_generation(student_dir, session_id):
+    """Create an empty generation directory and return its path relative to student_dir.
+    Must be called with generation_lock held, so the orphan scan cannot sweep it
+    before it is switched in."""
+    generation = f"{session_id}-{uuid.uuid4().hex[:8]}"
+    relative_path = os.path.join(GENERATIONS_DIRNAME, generation)
+    os.makedirs(os.path.join(student_dir, relative_path))
+    return relative_path
+
+def switch_generation(faces_dir, relative_path):
+    """Atomically point faces_dir at a generation and return the previous generation path"""
+    with generation_lock:
+        previous = os.path.realpath(faces_dir) if os.path.islink(faces_dir) else None
+        temp_link = f"{faces_dir}.{uuid.uuid4().hex[:8]}.tmp"
+        os.symlink(relative_path, temp_link)
+        os.replace(temp_link, faces_dir)
+    return previous
+
+def ensure_faces_dir(student_dir, faces_dir, session_id):
+    """Make sure faces_dir is a pointer to a generation, migrating plain directories"""
+    if not generations_supported():
+        os.makedirs(faces_dir, exist_ok=True)
+        return
+    start_reaper()
+    with generation_lock:
+        if os.path.islink(faces_dir):
+            if os.path.isdir(faces_dir):
+                return
+            # Dangling pointer, start a fresh generation
+            switch_generation(faces_dir, new_generation(student_dir, session_id))
+            return
+        os.makedirs(os.path.join(student_dir, GENERATIONS_DIRNAME), exist_ok=True)
+        if os.path.isdir(faces_dir):
+            # Older layout: move the existing crops into a generation (a single rename)
+            relative_path = os.path.join(GENERATIONS_DIRNAME, f"legacy-{uuid.uuid4().hex[:8]}")
+            os.rename(faces_dir, os.path.join(student_dir, relative_path))
+        else:
+            relative_path = new_generation(student_dir, session_id)
+        switch_generation(faces_dir, relative_path)
+
+def reap_generation(generation_dir):
+    """Delete a retired generation at a limited rate"""
+    delay = 1.0 / REAPER_FILES_PER_SECOND
+    for file in os.listdir(generation_dir):
+        file_path = os.path.join(generation_dir, file)
+        if os.path.isfile(file_path):
+            os.unlink(file_path)
+        time.sleep(delay)
+    # Remove anything left over (subdirectories, late writes) in one go
+    shutil.rmtree(generation_dir)
+
+def enqueue_orphaned_generations():
+    """Queue generations left behind by a previous run for deletion"""
+    for student_id in os.listdir(DATA_DIR):
+        generations_dir = os.path.join(DATA_DIR, student_id, GENERATIONS_DIRNAME)
+        if not os.path.isdir(generations_dir):
+            continue
+        # Hold the lock so a concurrent reset cannot make the live generation look orphaned
+        with generation_lock:
+            current = os.path.realpath(os.path.join(DATA_DIR, student_id, student_id))
+            generations = os.listdir(generations_dir)
+        for generation in generations:
+            generation_dir = os.path.realpath(os.path.join(generations_dir, generation))
+            if generation_dir != current:
+                reap_queue.put(generation_dir)
+
+def generation_reaper():
+    """Background worker that garbage-collects retired face generations"""
+    enqueue_orphaned_generations()
+    deferred = []  # (retry_at, generation_dir, attempts) for failed generations
+    while True:
+        now = time.time()
+        due = [item for item in deferred if item[0] <= now]
+        deferred = [item for item in deferred if item[0] > now]
+        pending = [(generation_dir, attempts) for _, generation_dir, attempts in due]
+        
+        try:
+            pending.append((reap_queue.get(timeout=REAPER_RETRY_DELAY), 0))
+        except queue.Empty:
+            pass
+        
+        for generation_dir, attempts in pending:
+            try:
+                if os.path.isdir(generation_dir):
+                    reap_generation(generation_dir)
+                    print(f"Reaped old face generation: {generation_dir}")
+            except OSError as e:
+                attempts += 1
+                if attempts >= REAPER_MAX_ATTEMPTS:
+                    print(f"Error: Giving up on reaping {generation_dir} after {attempts} attempts: {e}")
+                    continue
+                print(f"Warning: Could not reap {generation_dir}, retrying later: {e}")
+                retry_at = time.time() + REAPER_RETRY_DELAY * 2 ** (attempts - 1)
+                deferred.append((retry_at, generation_dir, attempts))
+
 # Face processing functions
 def preprocess_face_for_lightcnn(face_img, target_size=(128, 128)):
     """
@@ -72,8 +214,11 @@ def preprocess_face_for_lightcnn(face_img, target_size=(128, 128)):
 
 def extract_faces_from_video(video_path, output_dir, face_confidence=0.3, face_padding=0.2):
     """Extract faces from video and save preprocessed images using YOLO"""
-    # Check if output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    # Check if output directory exists; it is never recreated, since a missing
+    # directory means its generation was retired by a reset
+    if not os.path.isdir(output_dir):
+        print(f"Error: Output directory {output_dir} does not exist")
+        return 0
     
     # Initialize face detector with YOLO
     try:
@@ -190,8 +335,8 @@ def extract_faces_from_video(video_path, output_dir, face_confidence=0.3, face_p
                                 if processed_face.shape != (128, 128):
                                     processed_face = cv2.resize(processed_face, (128, 128), interpolation=cv2.INTER_LANCZOS4)
                                 # Save the image
-                                cv2.imwrite(filepath, processed_face)
-                                faces_saved += 1
+                                if cv2.imwrite(filepath, processed_face):
+                                    faces_saved += 1
             else:
                 # Fallback to Haar cascade detection
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
@@ -237,8 +382,8 @@ def extract_faces_from_video(video_path, output_dir, face_confidence=0.3, face_p
                         if processed_face.shape != (128, 128):
                             processed_face = cv2.resize(processed_face, (128, 128), interpolation=cv2.INTER_LANCZOS4)
                         # Save the image
-                        cv2.imwrite(filepath, processed_face)
-                        faces_saved += 1
+                        if cv2.imwrite(filepath, processed_face):
+                            faces_saved += 1
     
     # Close resources
     cap.release()
@@ -270,7 +415,7 @@ def start_session():
     
     # Create faces directory named after registration number (instead of "faces")
     faces_dir = os.path.join(student_dir, student_id)
-    os.makedirs(faces_dir, exist_ok=True)
+    ensure_faces_dir(student_dir, faces_dir, session_id)
     
     # Create session info
     session_data = {
@@ -307,15 +452,16 @@ def upload_video(session_id):
     student_dir = os.path.join(DATA_DIR, student_id)
     os.makedirs(student_dir, exist_ok=True)
     
-    # Create faces directory named after registration number
-    faces_dir = os.path.join(student_dir, student_id)
-    os.makedirs(faces_dir, exist_ok=True)
-    
     # Get existing session data
     session_file = os.path.join(student_dir, f"{session_id}.json")
     if not os.path.exists(session_file):
         return jsonify({"error": "Invalid session"}), 404
     
+    # Resolve the current face generation so a concurrent reset cannot mix crops
+    faces_dir = os.path.join(student_dir, student_id)
+    ensure_faces_dir(student_dir, faces_dir, session_id)
+    faces_dir = os.path.realpath(faces_dir)
+    
     with open(session_file, 'r') as f:
         session_data = json.load(f)
     
@@ -389,9 +535,20 @@ def upload_video(session_id):
         if dept:
             session_data["dept"] = dept
         
-        # Save updated session data
-        with open(session_file, 'w') as f:
-            json.dump(session_data, f)
+        # Check and save under the lock so a reset cannot land in between
+        with generation_lock:
+            # A reset during extraction retires the generation we wrote into
+            if os.path.realpath(os.path.join(student_dir, student_id)) != faces_dir:
+                retire_generation(faces_dir)
+                print(f"Faces were reset during extraction, discarding {faces_count} faces")
+                return jsonify({
+                    "success": False,
+                    "message": "Face data was reset while the video was processing"
+                }), 409
+            
+            # Save updated session data
+            with open(session_file, 'w') as f:
+                json.dump(session_data, f)
         
         # Keep the MP4 video file for reference
         print(f"Keeping MP4 video file for reference: {mp4_path}")
@@ -418,26 +575,36 @@ def reset_faces(session_id):
     student_dir = os.path.join(DATA_DIR, student_id)
     faces_dir = os.path.join(student_dir, student_id)  # Changed from 'faces' to student_id
     
-    if os.path.exists(faces_dir):
+    # lexists so a dangling link (lost generation) is repaired rather than reported missing
+    if os.path.lexists(faces_dir):
         try:
-            # Delete all files in faces directory
-            for file in os.listdir(faces_dir):
-                file_path = os.path.join(faces_dir, file)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            
-            # Reset session data
-            session_file = os.path.join(student_dir, f"{session_id}.json")
-            if os.path.exists(session_file):
-                with open(session_file, 'r') as f:
-                    session_data = json.load(f)
-                
-                session_data["facesExtracted"] = False
-                session_data["facesCount"] = 0
-                session_data["resetTime"] = datetime.now().isoformat()
+            with generation_lock:
+                if generations_supported():
+                    # Swap in an empty generation; the old crops are deleted in the background
+                    ensure_faces_dir(student_dir, faces_dir, session_id)
+                    relative_path = new_generation(student_dir, session_id)
+                    previous = switch_generation(faces_dir, relative_path)
+                    if previous:
+                        retire_generation(previous)
+                else:
+                    # Delete all files in faces directory
+                    for file in os.listdir(faces_dir):
+                        file_path = os.path.join(faces_dir, file)
+                        if os.path.isfile(file_path):
+                            os.unlink(file_path)
                 
-                with open(session_file, 'w') as f:
-                    json.dump(session_data, f)
+                # Reset session data
+                session_file = os.path.join(student_dir, f"{session_id}.json")
+                if os.path.exists(session_file):
+                    with open(session_file, 'r') as f:
+                        session_data = json.load(f)
+                    
+                    session_data["facesExtracted"] = False
+                    session_data["facesCount"] = 0
+                    session_data["resetTime"] = datetime.now().isoformat()
+                    
+                    with open(session_file, 'w') as f:
+                        json.dump(session_data, f)
             
             return jsonify({
                 "success": True, 